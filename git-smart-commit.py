@@ -7,19 +7,47 @@ Git智能提交信息生成器
 """
 
 import argparse
+import functools
+import io
 import os
 import subprocess
 import sys
 import re
-import shutil
 import json
-from datetime import datetime
 from typing import List, Dict, Any, Optional, Union
 import time
+import hashlib
 
 # 全局调试模式标志
 DEBUG = False
 LOG_FILE = "git-smart-commit.log"
+# 调试日志句柄：init_log_file 之前是内存缓冲区，之后换成只打开一次的日志文件；
+# 缓冲区在导入时创建，并发记录日志的线程不会各自创建而丢失日志
+_LOG_FH = io.StringIO()
+# 发送给LLM的差异内容上限（字节）
+MAX_DIFF_BYTES = 128 * 1024
+# 缓存目录，按仓库存放上下文缓存
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "git-smart-commit")
+# 当前仓库的.git目录、工作区根目录和共享目录（链接的工作树的config在共享目录中），由 check_git_repo 设置
+GIT_DIR = None
+WORK_TREE = None
+GIT_COMMON_DIR = None
+# 子进程使用的环境变量，只在加载时构建一次，确保Git使用UTF-8输出
+_GIT_ENV = {**os.environ, "PYTHONIOENCODING": "utf-8", "LC_ALL": "en_US.UTF-8", "LANG": "en_US.UTF-8"}
+_OLLAMA_ENV = {**os.environ, "PYTHONIOENCODING": "utf-8"}
+# ollama服务地址，与ollama自身一样读取 OLLAMA_HOST 环境变量
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "127.0.0.1:11434")
+# 模型在ollama中常驻的时长，连续多次调用时无需重新加载模型
+OLLAMA_KEEP_ALIVE = "30m"
+# 并发请求数，与ollama服务端的 OLLAMA_NUM_PARALLEL 设置保持一致；无效的值使用默认值4，至少为1
+try:
+    OLLAMA_NUM_PARALLEL = max(1, int(os.environ.get("OLLAMA_NUM_PARALLEL") or 4))
+except ValueError:
+    OLLAMA_NUM_PARALLEL = 4
+# 差异过大时逐文件总结的最大文件数
+MAX_SUMMARY_FILES = 20
+# LLM回复缓存最多保留的条数
+MAX_CACHED_RESPONSES = 200
 
 # 颜色定义
 class Colors:
@@ -31,81 +59,135 @@ class Colors:
     MAGENTA = '\033[0;35m'
     NC = '\033[0m'  # 无颜色
 
+# 输出不是终端（管道、CI）或 NO_COLOR 设置为非空值时不输出颜色转义序列
+_USE_COLOR = sys.stdout.isatty() and not os.environ.get("NO_COLOR")
+if not _USE_COLOR:
+    for _name in ("RED", "GREEN", "YELLOW", "BLUE", "CYAN", "MAGENTA", "NC"):
+        setattr(Colors, _name, "")
+
+# 日志级别对应的颜色，未列出的级别使用蓝色
+_LEVEL_COLORS = {"ERROR": Colors.RED, "WARNING": Colors.YELLOW, "DEBUG": Colors.CYAN}
+
+# 语言参数的别名，统一转换为 english/chinese
+_LANG_ALIAS = {"英文": "english", "中文": "chinese", "en": "english", "zh": "chinese"}
+
+def is_chinese(language):
+    """判断语言参数是否为中文"""
+    return language.lower() in ("chinese", "中文")
+
 def debug_log(message, data=None, level="INFO"):
-    """记录调试信息"""
+    """记录调试信息；data 可以是无参函数，只在调试模式下才会调用它生成数据"""
     if not DEBUG:
         return
     
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    color = Colors.BLUE
+    if callable(data):
+        data = data()
     
-    if level == "ERROR":
-        color = Colors.RED
-    elif level == "WARNING":
-        color = Colors.YELLOW
-    elif level == "DEBUG":
-        color = Colors.CYAN
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    color = _LEVEL_COLORS.get(level, Colors.BLUE)
     
     # 构建日志消息
     log_message = f"[{timestamp}] [{level}] {message}"
     
-    # 输出到控制台
-    print_color(f"🔍 {log_message}", color)
+    # 输出到控制台，整条日志拼好后一次写出
+    console = [f"{color}🔍 {log_message}{Colors.NC}\n"]
     
-    # 如果有数据，以格式化方式显示
+    # 如果有数据，以格式化方式显示；字典和列表只序列化一次，控制台和日志文件共用
     if data:
+        if isinstance(data, (dict, list)):
+            text = dump_debug_json(data)
+        else:
+            text = str(data)
         if isinstance(data, str) and len(data) > 500:
             # 如果数据是长字符串，限制显示长度
-            print_color("数据内容（部分）:", Colors.MAGENTA)
-            print(data[:500] + "...\n(内容过长，已截断。完整内容请查看日志文件)")
+            console.append(f"{Colors.MAGENTA}数据内容（部分）:{Colors.NC}\n{data[:500]}...\n(内容过长，已截断。完整内容请查看日志文件)\n")
         else:
-            print_color("数据内容:", Colors.MAGENTA)
-            if isinstance(data, (dict, list)):
-                print(json.dumps(data, ensure_ascii=False, indent=2))
-            else:
-                print(data)
-    
-    # 同时写入日志文件
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"{log_message}\n")
-        if data:
-            if isinstance(data, (dict, list)):
-                f.write(json.dumps(data, ensure_ascii=False, indent=2) + "\n")
-            else:
-                f.write(str(data) + "\n")
-        f.write("\n")
+            console.append(f"{Colors.MAGENTA}数据内容:{Colors.NC}\n{text}\n")
+    sys.stdout.write("".join(console))
+    
+    # 同时写入日志文件；多个线程会并发记录日志，每条日志拼成一个字符串一次写入，避免互相穿插
+    if data:
+        get_log_file().write(f"{log_message}\n{text}\n\n")
+    else:
+        get_log_file().write(f"{log_message}\n\n")
 
-def print_color(text, color, **kwargs):
-    """使用颜色输出文本"""
-    print(f"{color}{text}{Colors.NC}", **kwargs)
+def dump_debug_json(data):
+    """把调试数据格式化为缩进的JSON，安装了orjson时使用它，否则使用标准库json"""
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson as _orjson
+        except ImportError:
+            _orjson = False
+    if _orjson:
+        return _orjson.dumps(data, option=_orjson.OPT_INDENT_2 | _orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, indent=2)
 
-def check_git_repo():
-    """检查当前目录是否为git仓库"""
+# orjson模块，首次格式化调试数据时导入，未安装时为False
+_orjson = None
+
+def get_log_file():
+    """返回日志句柄；init_log_file 之前返回内存缓冲区，提前退出时不会创建或截断日志文件"""
+    return _LOG_FH
+
+def init_log_file():
+    """截断并打开带缓冲的日志文件，补写之前缓存在内存中的日志，进程退出时统一刷新并关闭"""
+    global _LOG_FH
+    import atexit
+    pending = _LOG_FH.getvalue()
+    _LOG_FH = open(LOG_FILE, "w", encoding="utf-8", buffering=64 * 1024)
+    atexit.register(_LOG_FH.close)
+    _LOG_FH.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 开始新的执行记录\n\n")
+    _LOG_FH.write(pending)
+
+def print_color(text, color, end="\n"):
+    """使用颜色输出文本
+    
+    直接写入sys.stdout，与流式输出的LLM内容共用同一个文本缓冲区，保证输出顺序
+    """
+    if _USE_COLOR:
+        sys.stdout.write(f"{color}{text}{Colors.NC}{end}")
+    else:
+        sys.stdout.write(f"{text}{end}")
+
+@functools.lru_cache(maxsize=1)
+def find_repo_dirs():
+    """返回当前仓库 (.git目录, 工作区根目录, 共享目录) 的绝对路径，不在git仓库中时返回None；结果在进程内缓存"""
     try:
-        subprocess.run(
-            ["git", "rev-parse", "--is-inside-work-tree"],
-            stdout=subprocess.DEVNULL,
+        # 顺便取得.git目录、工作区根目录和共享目录，省去额外的git调用
+        result = subprocess.run(
+            ["git", "rev-parse", "--is-inside-work-tree", "--absolute-git-dir", "--show-toplevel", "--git-common-dir"],
+            stdout=subprocess.PIPE,
             stderr=subprocess.DEVNULL,
-            check=True
+            text=True,
+            check=True,
+            env=_GIT_ENV
         )
-        debug_log("检查Git仓库：当前目录是有效的Git仓库")
-        return True
     except subprocess.CalledProcessError:
+        return None
+    _, git_dir, work_tree, common_dir = result.stdout.strip().splitlines()[-4:]
+    # --git-common-dir 可能输出相对当前目录的路径
+    return git_dir, work_tree, os.path.abspath(common_dir)
+
+def check_git_repo():
+    """检查当前目录是否为git仓库"""
+    global GIT_DIR, WORK_TREE, GIT_COMMON_DIR
+    repo_dirs = find_repo_dirs()
+    if repo_dirs is None:
         print_color("错误: 当前目录不是git仓库", Colors.RED)
         debug_log("检查Git仓库：当前目录不是Git仓库", level="ERROR")
         return False
+    GIT_DIR, WORK_TREE, GIT_COMMON_DIR = repo_dirs
+    debug_log("检查Git仓库：当前目录是有效的Git仓库", f"Git目录: {GIT_DIR}，工作区: {WORK_TREE}")
+    return True
 
 def run_git_command(command, check=True):
     """运行git命令并返回输出"""
-    debug_log(f"执行Git命令: {' '.join(command)}")
+    # 调试关闭时连日志参数都不构建，git命令执行频繁
+    if DEBUG:
+        debug_log(f"执行Git命令: {' '.join(command)}")
     
     try:
-        # 设置环境变量，确保Git使用UTF-8输出
-        env = os.environ.copy()
-        env["PYTHONIOENCODING"] = "utf-8"
-        env["LC_ALL"] = "en_US.UTF-8"
-        env["LANG"] = "en_US.UTF-8"
-        
         result = subprocess.run(
             command,
             stdout=subprocess.PIPE,
@@ -114,15 +196,16 @@ def run_git_command(command, check=True):
             text=True,
             encoding='utf-8',  # 明确指定编码为UTF-8
             errors='replace',  # 处理无法解码的字符
-            env=env
+            env=_GIT_ENV
         )
         
         if result.returncode != 0:
             debug_log(f"Git命令返回错误代码: {result.returncode}", result.stderr, "WARNING")
         else:
-            # 只在调试模式下记录完整输出，避免日志过大
-            if DEBUG and result.stdout:
-                debug_log("Git命令输出:", result.stdout[:1000] + "..." if len(result.stdout) > 1000 else result.stdout)
+            # 只在调试模式下记录完整输出，避免日志过大；-z 输出中的NUL换成换行，
+            # 否则终端和日志文件里会出现NUL字节，grep会把日志当作二进制文件
+            if result.stdout:
+                debug_log("Git命令输出:", lambda: (result.stdout[:1000] + "..." if len(result.stdout) > 1000 else result.stdout).replace("\0", "\n"))
         
         return result.stdout.strip() if result.stdout else ""
     except subprocess.CalledProcessError as e:
@@ -138,57 +221,390 @@ def run_git_command(command, check=True):
             sys.exit(1)
         return ""
 
-def get_git_changes():
-    """获取git变动内容"""
+def stream_git_output(command, buffer, max_bytes):
+    """流式读取git命令输出并追加到buffer，超过上限时提前终止git进程，返回是否被截断"""
+    if DEBUG:
+        debug_log(f"流式执行Git命令: {' '.join(command)}", f"读取上限: {max_bytes} 字节")
+    
+    try:
+        proc = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=_GIT_ENV
+        )
+    except Exception as e:
+        print_color(f"执行命令时发生异常: {e}", Colors.RED)
+        debug_log(f"执行Git命令时发生异常", str(e), "ERROR")
+        sys.exit(1)
+    
+    # 以64KB为单位读取，达到上限后不再读取剩余内容
+    start = len(buffer)
+    limit = start + max_bytes
+    truncated = False
+    while True:
+        chunk = proc.stdout.read1(64 * 1024)
+        if not chunk:
+            break
+        buffer += chunk
+        if len(buffer) > limit:
+            truncated = True
+            break
+    
+    if truncated:
+        proc.kill()
+        # 在最后一个完整行处截断，避免把半行内容交给LLM
+        del buffer[limit:]
+        last_newline = buffer.rfind(b"\n", start)
+        if last_newline > start:
+            del buffer[last_newline:]
+    
+    # 原地去掉末尾的空白行，不产生新的副本
+    while len(buffer) > start and buffer[-1:] in (b"\n", b"\r", b" "):
+        del buffer[-1:]
+    
+    proc.stdout.close()
+    stderr = proc.stderr.read()
+    proc.stderr.close()
+    returncode = proc.wait()
+    
+    if not truncated and returncode != 0:
+        print_color(f"错误: 执行Git命令失败: {stderr.decode('utf-8', errors='replace').strip()}", Colors.RED)
+        debug_log(f"Git命令返回错误代码: {returncode}", stderr.decode("utf-8", errors="replace"), "ERROR")
+        sys.exit(1)
+    
+    return truncated
+
+def read_git_output_capped(command, max_bytes):
+    """流式读取git命令输出，超过上限时提前终止git进程，返回 (输出, 是否被截断)"""
+    buffer = bytearray()
+    truncated = stream_git_output(command, buffer, max_bytes)
+    return buffer.decode("utf-8", errors="replace"), truncated
+
+# 锁文件和压缩产物的差异对生成提交信息没有帮助，只在文件列表中保留
+_SKIP_DIFF_GLOBS = (
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "Cargo.lock",
+    "go.sum", "poetry.lock", "Pipfile.lock", "composer.lock", "Gemfile.lock", "*.min.js", "*.min.css",
+)
+
+def is_skipped_diff_path(path):
+    """判断文件的差异是否应该从LLM提示中省略"""
+    from fnmatch import fnmatch
+    name = os.path.basename(path)
+    return any(fnmatch(name, pattern) for pattern in _SKIP_DIFF_GLOBS)
+
+def get_git_changes(name_status, max_bytes=MAX_DIFF_BYTES):
+    """获取git变动内容，name_status 为 collect_repo_state 得到的已暂存文件列表，返回 (变更内容, 差异是否被截断)"""
     debug_log("获取Git变动内容")
-    staged_files = run_git_command(["git", "diff", "--staged", "--name-status"])
+    staged_files = "\n".join(name_status)
     debug_log("已暂存文件列表:", staged_files)
     
-    staged_diff = run_git_command(["git", "diff", "--staged"])
-    debug_log("已暂存的变更内容:", "内容过长，记录到日志文件")
-    
-    # 将完整差异内容写入日志
+    # 文件列表和差异写入同一个缓冲区，最后只解码一次，避免拼接大字符串
+    buffer = bytearray(staged_files.encode("utf-8"))
+    buffer += b"\n\n"
+    
+    # 删除的文件只在文件列表中体现；重命名/复制检测可以避免输出整份文件内容
+    # 锁文件等通过pathspec排除，git不会生成它们的差异
+    # 上下文只保留1行以减少发送给LLM的字节数；不调用外部diff工具，保证输出是标准格式
+    excludes = [f":(top,exclude,glob)**/{pattern}" for pattern in _SKIP_DIFF_GLOBS]
+    truncated = stream_git_output(
+        ["git", "diff", "--staged", "--no-color", "--no-ext-diff", "-U1", "-M", "-C", "--diff-filter=ACMRT", "--", *excludes],
+        buffer,
+        max_bytes
+    )
+    skipped = [line.rsplit("\t", 1)[-1] for line in name_status if is_skipped_diff_path(line.rsplit("\t", 1)[-1])]
+    if skipped:
+        buffer += f"\n\n(以下锁文件或压缩文件的差异已省略: {', '.join(skipped)})".encode("utf-8")
+    if truncated:
+        buffer += f"\n\n...(差异内容超过 {max_bytes} 字节，其余部分已省略)".encode("utf-8")
+        # 附上全部文件的增删统计，让LLM了解被省略部分的规模
+        diff_stat, _ = read_git_output_capped(["git", "diff", "--staged", "--stat", "--no-color", "-M", "-C"], max(max_bytes // 4, 16 * 1024))
+        if diff_stat:
+            buffer += f"\n\n变更统计:\n{diff_stat}".encode("utf-8")
+        print_color(f"提示: 差异内容超过 {max_bytes} 字节，已截断后发送给LLM", Colors.YELLOW)
+    changes = buffer.decode("utf-8", errors="replace")
+    # 完整差异会随LLM提示一起写入日志，这里只记录大小和摘要
     if DEBUG:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write("\n--- STAGED DIFF BEGIN ---\n")
-            f.write(staged_diff)
-            f.write("\n--- STAGED DIFF END ---\n\n")
+        digest = hashlib.sha1(buffer).hexdigest()[:12]
+        debug_log(f"已暂存的变更内容: {len(buffer)} 字节，sha1={digest}，完整内容见LLM提示")
     
-    return f"{staged_files}\n\n{staged_diff}"
+    return changes, truncated
+
+# porcelain v2 各类记录中路径之前的字段数
+_PORCELAIN_V2_FIELDS = {"1": 8, "2": 9, "u": 10}
+
+def collect_repo_state():
+    """一次 git status 调用收集分支、上游、已暂存/未暂存文件和submodule变化"""
+    debug_log("收集仓库状态")
+    status = run_git_command(
+        ["git", "status", "--porcelain=v2", "--branch", "--untracked-files=no", "-z"],
+        check=False
+    )
+    
+    state = {"oid": None, "branch": None, "upstream": None, "staged": [], "unstaged": [], "submodules": [],
+             "staged_submodules": [], "name_status": []}
+    # -z 输出以NUL分隔记录，路径不做转义
+    records = iter(status.split("\0"))
+    for record in records:
+        if record.startswith("# branch.oid "):
+            oid = record[len("# branch.oid "):]
+            state["oid"] = None if oid == "(initial)" else oid
+            continue
+        if record.startswith("# branch.head "):
+            head = record[len("# branch.head "):]
+            state["branch"] = None if head == "(detached)" else head
+            continue
+        if record.startswith("# branch.upstream "):
+            state["upstream"] = record[len("# branch.upstream "):]
+            continue
+        
+        # 普通变更: "1 XY sub ..."，重命名: "2 XY sub ..."，冲突: "u XY sub ..."
+        # 三种记录在路径之前的字段数不同
+        maxsplit = _PORCELAIN_V2_FIELDS.get(record[:1])
+        if maxsplit is None:
+            continue
+        fields = record.split(" ", maxsplit)
+        orig_path = None
+        if record[0] == "2":
+            # 重命名记录后面紧跟一个单独的原路径记录
+            orig_path = next(records, None)
+        if len(fields) <= maxsplit:
+            continue
+        xy, sub, path = fields[1], fields[2], fields[-1]
+        
+        # 与 git diff --staged --name-status 相同格式的已暂存文件列表
+        if record[0] == "u":
+            state["name_status"].append(f"U\t{path}")
+        elif xy[0] != ".":
+            if orig_path is not None:
+                # 重命名记录的第9个字段是 "R<相似度>"，name-status中相似度补齐为三位
+                score = fields[8]
+                state["name_status"].append(f"{score[0]}{score[1:].zfill(3)}\t{orig_path}\t{path}")
+            else:
+                state["name_status"].append(f"{xy[0]}\t{path}")
+        
+        # sub字段以S开头表示该条目是submodule
+        if sub.startswith("S"):
+            state["submodules"].append(path)
+            # 普通和重命名记录带有HEAD与暂存区中的提交哈希，新增的submodule没有旧提交
+            if xy[0] != "." and record[0] != "u" and fields[6] != fields[7] and fields[6].strip("0"):
+                state["staged_submodules"].append([path, fields[6], fields[7]])
+        
+        if xy[0] != ".":
+            state["staged"].append(path)
+        if xy[1] != ".":
+            state["unstaged"].append(path)
+    
+    debug_log("仓库状态:", state)
+    return state
+
+def _file_signature(path):
+    """返回文件的 (mtime_ns, size)，文件不存在时返回None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
 
-def get_repo_info():
+def get_context_cache_key(repo_state, max_bytes):
+    """根据HEAD、索引和.gitmodules的状态计算上下文缓存键"""
+    fingerprint = (
+        repo_state["oid"],
+        repo_state["branch"],
+        _file_signature(os.path.join(GIT_DIR, "index")),
+        _file_signature(os.path.join(GIT_COMMON_DIR, "config")),
+        _file_signature(os.path.join(WORK_TREE, ".gitmodules")),
+        max_bytes,
+    )
+    return hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()
+
+def _make_private_dir(path):
+    """创建只有当前用户可访问的缓存目录；缓存中有暂存的差异和LLM回复，可能包含敏感内容"""
+    os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+    # 旧版本按umask创建的缓存目录一并收紧权限
+    os.chmod(CACHE_DIR, 0o700)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+def _open_private(path):
+    """以0600权限创建并写入缓存文件"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return os.fdopen(fd, "w", encoding="utf-8")
+
+def _context_cache_dir():
+    """当前仓库的缓存目录"""
+    repo_hash = hashlib.sha1(GIT_DIR.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, repo_hash)
+
+def load_cached_context(cache_key):
+    """读取磁盘上的上下文缓存，未命中时返回None"""
+    cache_file = os.path.join(_context_cache_dir(), f"{cache_key}.json")
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        debug_log(f"命中上下文缓存: {cache_file}")
+        return {key: cached[key] for key in ("repo_info", "changes", "submodule_info", "diff_truncated")}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        debug_log("读取上下文缓存失败", str(e), "WARNING")
+        return None
+
+def save_cached_context(cache_key, context):
+    """写入上下文缓存；同一仓库只保留最新状态的一份"""
+    cache_dir = _context_cache_dir()
+    try:
+        _make_private_dir(cache_dir)
+        # 索引或HEAD变化后旧缓存不会再命中，直接清理
+        for name in os.listdir(cache_dir):
+            if name != f"{cache_key}.json":
+                os.remove(os.path.join(cache_dir, name))
+        with _open_private(os.path.join(cache_dir, f"{cache_key}.json")) as f:
+            json.dump(context, f, ensure_ascii=False)
+        debug_log(f"已写入上下文缓存: {cache_key}")
+    except OSError as e:
+        debug_log("写入上下文缓存失败", str(e), "WARNING")
+
+def _response_cache_file(cache_key):
+    """LLM回复缓存文件路径，所有仓库共用一个目录"""
+    return os.path.join(CACHE_DIR, "responses", f"{cache_key}.json")
+
+def load_cached_response(cache_key):
+    """读取缓存的LLM回复，未命中时返回None"""
+    cache_file = _response_cache_file(cache_key)
+    try:
+        with open(cache_file, "r", encoding="utf-8") as f:
+            response = json.load(f)["response"]
+        # 命中时刷新修改时间，淘汰按最近使用顺序进行
+        os.utime(cache_file)
+        debug_log(f"命中LLM回复缓存: {cache_key}")
+        return response
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        debug_log("读取LLM回复缓存失败", str(e), "WARNING")
+        return None
+
+def save_cached_response(cache_key, response):
+    """写入LLM回复缓存，超过上限时删除最久未使用的条目"""
+    cache_file = _response_cache_file(cache_key)
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        _make_private_dir(cache_dir)
+        with _open_private(cache_file) as f:
+            json.dump({"response": response}, f, ensure_ascii=False)
+        entries = sorted(os.scandir(cache_dir), key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[:-MAX_CACHED_RESPONSES]:
+            os.remove(entry.path)
+        debug_log(f"已写入LLM回复缓存: {cache_key}")
+    except OSError as e:
+        debug_log("写入LLM回复缓存失败", str(e), "WARNING")
+
+def collect_git_context(repo_state, max_bytes, use_cache=True):
+    """获取仓库信息、变更内容和submodule变化，按HEAD和索引状态缓存结果"""
+    from concurrent.futures import ThreadPoolExecutor
+    
+    cache_key = get_context_cache_key(repo_state, max_bytes)
+    if use_cache:
+        cached = load_cached_context(cache_key)
+        if cached is not None:
+            print_color("仓库状态未变化，使用缓存的仓库上下文 (使用 --no-cache 重新收集)", Colors.BLUE)
+            return cached
+    
+    # 并发获取仓库信息、变更内容和submodule变化
+    # 状态中没有已暂存的submodule变化时不必为它占用线程
+    staged_submodules = repo_state["staged_submodules"]
+    with ThreadPoolExecutor(max_workers=3 if staged_submodules else 2) as executor:
+        repo_info_future = executor.submit(get_repo_info, repo_state)
+        changes_future = executor.submit(get_git_changes, repo_state["name_status"], max_bytes)
+        submodule_future = executor.submit(process_submodules, staged_submodules) if staged_submodules else None
+        changes, diff_truncated = changes_future.result()
+        context = {
+            "repo_info": repo_info_future.result(),
+            "changes": changes,
+            "submodule_info": submodule_future.result() if submodule_future else "",
+            "diff_truncated": diff_truncated
+        }
+    
+    if use_cache:
+        save_cached_context(cache_key, context)
+    return context
+
+def read_config_remote_url(remote="origin"):
+    """直接解析仓库的config文件读取远程地址，无法可靠解析时返回None"""
+    if not GIT_DIR:
+        return None
+    
+    # 链接的工作树（git worktree）与主仓库共享config文件
+    try:
+        with open(os.path.join(GIT_COMMON_DIR, "config"), "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        return None
+    
+    url = None
+    in_section = False
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("["):
+            header = line[1:line.find("]")].strip()
+            # include的配置文件需要git自己展开
+            if header.lower().startswith("include"):
+                return None
+            in_section = header == f'remote "{remote}"'
+            continue
+        if in_section:
+            key, sep, value = line.partition("=")
+            if sep and key.strip().lower() == "url":
+                value = value.strip()
+                # 含引号、转义或行内注释的值交给git解析
+                if any(c in value for c in '"\\#;'):
+                    return None
+                url = value
+    return url
+
+def get_remote_url():
+    """获取origin的远程地址，优先在进程内读取config，失败时调用git config"""
+    remote_url = read_config_remote_url()
+    if remote_url is not None:
+        debug_log(f"从config文件读取远程地址: {remote_url}")
+        return remote_url
+    return run_git_command(["git", "config", "--get", "remote.origin.url"], check=False)
+
+def get_repo_info(repo_state):
     """获取git仓库全局信息"""
+    from concurrent.futures import ThreadPoolExecutor
+    
     debug_log("获取仓库信息")
     
-    # 获取仓库名称
+    # 远程地址和最近提交记录互不依赖，并发获取以重叠子进程等待时间
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        remote_url_future = executor.submit(get_remote_url)
+        recent_commits_future = executor.submit(
+            run_git_command, ["git", "log", "-3", "--pretty=format:%h %s"], check=False
+        )
+    
+    # 获取仓库名称：取地址最后一段，兼容结尾的"/"和 git@host:name.git 形式
     try:
-        remote_url = run_git_command(["git", "config", "--get", "remote.origin.url"], check=False)
-        if remote_url:
-            repo_name = os.path.basename(remote_url)
-            if repo_name.endswith('.git'):
-                repo_name = repo_name[:-4]
-        else:
-            repo_name = "未知仓库"
-    except:
+        remote_url = remote_url_future.result()
+    except Exception:
+        remote_url = ""
+    repo_name = remote_url.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+    if repo_name.endswith('.git'):
+        repo_name = repo_name[:-4]
+    if not repo_name:
         repo_name = "未知仓库"
     
     debug_log(f"仓库名称: {repo_name}")
     
-    # 获取当前分支
-    try:
-        branch = run_git_command(["git", "symbolic-ref", "--short", "HEAD"], check=False)
-        if not branch:
-            branch = "detached HEAD"
-    except:
-        branch = "detached HEAD"
+    # 当前分支直接取自 collect_repo_state 的结果，无需再次调用git
+    branch = repo_state["branch"] or "detached HEAD"
     
     debug_log(f"当前分支: {branch}")
     
     # 获取最近几次提交信息作为上下文
-    recent_commits = run_git_command(
-        ["git", "log", "-3", "--pretty=format:%h %s"], 
-        check=False
-    )
+    recent_commits = recent_commits_future.result()
     if not recent_commits:
         recent_commits = "无提交记录"
     
@@ -196,206 +612,482 @@ def get_repo_info():
     
     return f"仓库: {repo_name}\n分支: {branch}\n最近提交记录:\n{recent_commits}"
 
-def process_submodules():
-    """处理submodule变化"""
-    debug_log("开始处理submodule变化")
-    submodule_summary = ""
+def log_submodule_range(submodule_path, old_hash, new_hash):
+    """读取单个子模块在 old_hash..new_hash 之间的提交记录，子模块不可用时返回空字符串"""
+    if DEBUG:
+        debug_log(f"处理submodule: {submodule_path}", f"旧哈希: {old_hash}, 新哈希: {new_hash}")
     
-    # 获取已暂存的submodule变化
-    submodule_diff = run_git_command(["git", "diff", "--staged", "--submodule"], check=False)
-    debug_log("submodule差异:", submodule_diff)
+    # 子模块的.git可能是目录也可能是gitdir文件，一次stat即可确认；不存在时再区分原因
+    if not os.path.exists(os.path.join(submodule_path, ".git")):
+        if not os.path.isdir(submodule_path):
+            print_color(f"警告: 子模块目录 {submodule_path} 不存在，跳过", Colors.YELLOW)
+            debug_log(f"子模块目录 {submodule_path} 不存在，跳过", level="WARNING")
+        else:
+            print_color(f"警告: {submodule_path} 不是git仓库，跳过", Colors.YELLOW)
+            debug_log(f"{submodule_path} 不是git仓库，跳过", level="WARNING")
+        return ""
+        
+    # 通过 git -C 在子模块中执行命令，不修改进程的工作目录，可以在多个线程中同时执行
+    command = ["git", "-C", submodule_path, "log", "--pretty=format:%h %s", f"{old_hash}..{new_hash}"]
+    sub_commits = run_git_command(command, check=False)
+    debug_log("子模块提交记录:", sub_commits)
+    return sub_commits
+
+def process_submodules(staged_submodules):
+    """处理submodule变化，staged_submodules 为 collect_repo_state 得到的 [路径, 旧哈希, 新哈希] 列表"""
+    from concurrent.futures import ThreadPoolExecutor
     
-    # 查找所有submodule变更
-    submodule_pattern = r"Submodule\s+([^\s]+)\s+([0-9a-f]+)\.\.([0-9a-f]+)"
-    matches = list(re.finditer(submodule_pattern, submodule_diff))
+    debug_log("开始处理submodule变化")
     
-    if not matches:
+    if not staged_submodules:
         debug_log("未检测到submodule变更")
-        return submodule_summary
+        return ""
     
-    debug_log(f"检测到 {len(matches)} 个submodule变更")
+    debug_log(f"检测到 {len(staged_submodules)} 个submodule变更")
+    for submodule_path, old_hash, new_hash in staged_submodules:
+        print_color(f"检测到submodule变化: {submodule_path} ({old_hash[:7]}..{new_hash[:7]})", Colors.YELLOW)
     
-    for match in matches:
-        submodule_path = match.group(1)
-        old_hash = match.group(2)
-        new_hash = match.group(3)
+    # 各子模块的git log互不依赖，并发执行；结果按原顺序汇总
+    with ThreadPoolExecutor(max_workers=min(8, len(staged_submodules))) as executor:
+        results = list(executor.map(lambda item: log_submodule_range(*item), staged_submodules))
+    
+    parts = []
+    for (submodule_path, _, _), sub_commits in zip(staged_submodules, results):
+        # 如果有提交信息，添加到汇总
+        if sub_commits:
+            parts.append(f"Submodule {submodule_path} 更新:\n{sub_commits}\n\n")
+            if DEBUG:
+                debug_log(f"添加子模块 {submodule_path} 的提交信息到汇总")
+    submodule_summary = "".join(parts)
+    
+    debug_log("submodule处理完成，汇总信息:", submodule_summary)
+    return submodule_summary
+
+class OllamaHTTPError(RuntimeError):
+    """ollama HTTP接口返回了非200状态，例如模型尚未拉取时的404"""
+
+class OllamaSession:
+    """与ollama服务保持的HTTP长连接，多次生成复用同一连接"""
+
+    def __init__(self, host):
+        self.host = host if "://" in host else f"http://{host}"
+        self.conn = None
+
+    def _connection(self):
+        """按需建立连接"""
+        if self.conn is None:
+            import http.client
+            from urllib.parse import urlsplit
+            
+            # 与ollama一致：":11434" 这类省略主机名的写法指向本机，https地址使用TLS连接
+            url = urlsplit(self.host)
+            hostname = url.hostname or "127.0.0.1"
+            if url.scheme == "https":
+                port = url.port or 443
+                self.conn = http.client.HTTPSConnection(hostname, port)
+            else:
+                port = url.port or 11434
+                self.conn = http.client.HTTPConnection(hostname, port)
+            debug_log(f"建立ollama HTTP连接: {url.scheme}://{hostname}:{port}")
+        return self.conn
+
+    def _post(self, path, payload):
+        """发送POST请求并返回响应；服务端关闭了空闲连接时重连一次"""
+        import http.client
         
-        print_color(f"检测到submodule变化: {submodule_path} ({old_hash}..{new_hash})", Colors.YELLOW)
-        debug_log(f"处理submodule: {submodule_path}", f"旧哈希: {old_hash}, 新哈希: {new_hash}")
+        # 直接以UTF-8编码非ASCII字符，中文等内容不会被转义成6字节的 \uXXXX
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request("POST", path, body, headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if attempt:
+                    raise
+
+    def generate(self, prompt, model, echo=True):
+        """流式生成，echo为True时边生成边输出到终端"""
+        response = self._post("/api/generate", {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": OLLAMA_KEEP_ALIVE
+        })
+        if response.status != 200:
+            detail = response.read().decode("utf-8", errors="replace")
+            try:
+                detail = json.loads(detail).get("error", detail)
+            except ValueError:
+                pass
+            raise OllamaHTTPError(f"ollama返回HTTP {response.status}: {detail}")
         
-        # 检查子模块目录是否存在
-        if not os.path.isdir(submodule_path):
-            print_color(f"警告: 子模块目录 {submodule_path} 不存在，跳过", Colors.YELLOW)
-            debug_log(f"子模块目录 {submodule_path} 不存在，跳过", level="WARNING")
+        parts = []
+        # 每行是一个JSON对象，response字段为新生成的文本片段
+        for line in response:
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(chunk["error"])
+            text = chunk.get("response", "")
+            if text:
+                parts.append(text)
+                if echo:
+                    sys.stdout.write(f"{Colors.CYAN}{text}{Colors.NC}")
+                    sys.stdout.flush()
+            if chunk.get("done"):
+                break
+        # 读完剩余内容，连接才能被下一次请求复用
+        response.read()
+        
+        if echo and parts:
+            sys.stdout.write("\n")
+        return "".join(parts).strip()
+
+    def close(self):
+        """关闭连接"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+_OLLAMA_SESSION = OllamaSession(OLLAMA_HOST)
+# ollama可执行文件的绝对路径，由 check_ollama_installed 设置，之后调用命令行时不再查找PATH
+_OLLAMA_BIN = None
+
+def call_ollama_cli(prompt, model, echo=True):
+    """通过ollama命令行生成，逐行读取输出并实时显示"""
+    import threading
+    
+    proc = subprocess.Popen(
+        [_OLLAMA_BIN or "ollama", "run", model],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        env=_OLLAMA_ENV
+    )
+    # ollama run 会向stderr持续输出进度动画和拉取进度，后台线程同时读取，
+    # 否则管道写满后ollama阻塞，这里读stdout也会一直等待
+    stderr_parts = []
+    stderr_thread = threading.Thread(target=lambda: stderr_parts.append(proc.stderr.read()), daemon=True)
+    stderr_thread.start()
+    
+    # ollama会先读完全部输入再开始生成，写完后关闭stdin即可
+    proc.stdin.write(prompt)
+    proc.stdin.close()
+    
+    parts = []
+    for line in proc.stdout:
+        parts.append(line)
+        if echo:
+            text = line.rstrip("\n")
+            sys.stdout.write(f"{Colors.CYAN}{text}{Colors.NC}\n")
+            sys.stdout.flush()
+    returncode = proc.wait()
+    stderr_thread.join()
+    stderr = "".join(stderr_parts)
+    output = "".join(parts)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, proc.args, output, stderr)
+    return output.strip()
+
+def call_ollama(prompt, model, session=None, echo=True):
+    """调用ollama生成回复，优先使用HTTP接口，服务不可达或返回错误状态时退回到命令行
+    
+    HTTP接口不会自动拉取模型，模型不存在时返回404；ollama run 会先拉取模型再生成
+    并发调用时每个线程需要传入自己的session，HTTP连接不能在线程间共享
+    """
+    session = session or _OLLAMA_SESSION
+    debug_log(f"开始调用ollama，模型: {model}")
+    try:
+        return session.generate(prompt, model, echo=echo)
+    except OSError as e:
+        session.close()
+        debug_log("ollama HTTP接口不可用，改用命令行调用", str(e), "WARNING")
+    except OllamaHTTPError as e:
+        debug_log("ollama HTTP接口返回错误，改用命令行调用", str(e), "WARNING")
+    return call_ollama_cli(prompt, model, echo=echo)
+
+# 逐文件总结变更的提示模板
+_FILE_SUMMARY_PROMPT_ZH = "请用一句话概括以下对文件 {path} 的变更及其目的，只输出这一句话。\n\n{diff}"
+_FILE_SUMMARY_PROMPT_EN = "Summarize the following change to {path} and its purpose in one sentence. Output only that sentence.\n\n{diff}"
+
+def read_file_diff(path, max_bytes, orig_path=None, stat=False):
+    """读取单个文件已暂存的差异（stat为True时只读取增删统计）；path 为相对仓库根目录的路径，重命名时 orig_path 为原路径"""
+    # 路径按仓库根目录解析且不做通配，在子目录中运行或文件名含特殊字符时也能取到差异；
+    # 重命名时同时给出原路径，git才能识别为重命名而不是新增整个文件
+    pathspecs = [f":(top,literal){p}" for p in (orig_path, path) if p]
+    options = ["--stat"] if stat else ["--no-ext-diff", "-U1"]
+    diff, _ = read_git_output_capped(["git", "diff", "--staged", "--no-color", *options, "-M", "--", *pathspecs], max_bytes)
+    return diff
+
+def summarize_file_change(path, model, language, max_bytes, orig_path=None):
+    """让LLM用一句话总结单个文件的变更"""
+    diff = read_file_diff(path, max_bytes, orig_path)
+    if is_chinese(language):
+        prompt = _FILE_SUMMARY_PROMPT_ZH.format(path=path, diff=diff)
+    else:
+        prompt = _FILE_SUMMARY_PROMPT_EN.format(path=path, diff=diff)
+    
+    session = OllamaSession(OLLAMA_HOST)
+    try:
+        return call_ollama(prompt, model, session=session, echo=False)
+    finally:
+        session.close()
+
+def summarize_changes_by_file(repo_state, model, language, max_bytes):
+    """差异过大时的map/reduce：并发为改动最多的文件生成摘要，汇总后代替完整差异"""
+    from concurrent.futures import ThreadPoolExecutor
+    
+    staged_files = "\n".join(repo_state["name_status"])
+    # -z 输出的路径不加引号，重命名记录为 "增\t删\t\0原路径\0新路径"，不会出现 "old => new" 形式
+    numstat = run_git_command(["git", "diff", "--staged", "--numstat", "-M", "-z"])
+    
+    # 按增删行数排序，只总结改动最多的文件，其余文件保留在文件列表中
+    file_sizes = []
+    fields = numstat.split("\0")
+    i = 0
+    while i < len(fields) and fields[i]:
+        added, deleted, path = fields[i].split("\t", 2)
+        orig_path = None
+        if not path:
+            orig_path, path = fields[i + 1], fields[i + 2]
+            i += 3
+        else:
+            i += 1
+        if is_skipped_diff_path(path):
             continue
-            
-        # 进入submodule目录
-        current_dir = os.getcwd()
+        size = (int(added) if added.isdigit() else 0) + (int(deleted) if deleted.isdigit() else 0)
+        file_sizes.append((size, path, orig_path))
+    file_sizes.sort(key=lambda item: item[0], reverse=True)
+    files = [(path, orig_path) for _, path, orig_path in file_sizes[:MAX_SUMMARY_FILES]]
+    paths = [path for path, _ in files]
+    
+    print_color(f"差异内容过大，正在并发总结 {len(paths)} 个文件的变更...", Colors.BLUE)
+    debug_log("逐文件总结的文件列表:", paths)
+    
+    # 每个文件的差异限制在总上限的1/4以内，保证单次调用的上下文足够短
+    per_file_bytes = max(max_bytes // 4, 1024)
+    
+    def summarize(item):
+        path, orig_path = item
         try:
-            os.chdir(submodule_path)
-            debug_log(f"进入子模块目录: {submodule_path}")
-            
-            # 检查子模块是否是git仓库
-            if not os.path.isdir(".git") and not os.path.isfile(".git"):
-                print_color(f"警告: {submodule_path} 不是git仓库，跳过", Colors.YELLOW)
-                debug_log(f"{submodule_path} 不是git仓库，跳过", level="WARNING")
-                os.chdir(current_dir)
-                continue
-                
-            # 获取submodule提交信息
-            command = ["git", "log", f"--pretty=format:%h %s", f"{old_hash}..{new_hash}"]
-            debug_log(f"执行子模块命令: {' '.join(command)}")
-            
-            sub_commits = run_git_command(command, check=False)
-            debug_log(f"子模块提交记录:", sub_commits)
-            
-            # 如果有提交信息，添加到汇总
-            if sub_commits:
-                submodule_summary += f"Submodule {submodule_path} 更新:\n{sub_commits}\n\n"
-                debug_log(f"添加子模块 {submodule_path} 的提交信息到汇总")
-                
+            return summarize_file_change(path, model, language, per_file_bytes, orig_path)
         except Exception as e:
-            print_color(f"处理submodule时出错: {e}", Colors.RED)
-            debug_log(f"处理submodule时出错", str(e), "ERROR")
+            debug_log(f"总结文件 {path} 时出错", str(e), "ERROR")
+            return ""
+    
+    with ThreadPoolExecutor(max_workers=OLLAMA_NUM_PARALLEL) as executor:
+        summaries = list(executor.map(summarize, files))
+    
+    # 摘要生成失败的文件改为附上截断后的差异；总量不超过差异上限，超出后只附增删统计
+    summary_lines = []
+    failed_blocks = []
+    budget = max_bytes
+    for (path, orig_path), summary in zip(files, summaries):
+        if summary.strip():
+            summary_lines.append(f"- {path}: {' '.join(summary.split())}")
+            continue
+        summary_lines.append(f"- {path}: (摘要生成失败，差异见下方)")
+        if budget >= 1024:
+            diff = read_file_diff(path, min(per_file_bytes, budget), orig_path)
+        else:
+            diff = read_file_diff(path, 4096, orig_path, stat=True)
+        budget -= len(diff.encode("utf-8"))
+        failed_blocks.append(diff)
+    summary_text = "\n".join(summary_lines)
+    debug_log("逐文件变更摘要:", summary_text)
+    result = f"{staged_files}\n\n逐文件变更摘要（差异内容过大，未附完整差异）:\n{summary_text}"
+    if failed_blocks:
+        result += "\n\n摘要生成失败的文件的差异（可能已截断）:\n" + "\n\n".join(failed_blocks)
+    return result
+
+# 生成提交信息的提示模板：固定的说明在前，变化的仓库内容在后，
+# 相同设置下提示前缀逐字节一致，ollama可以复用已计算的前缀KV缓存
+_COMMIT_PROMPT_ZH = (
+    "请基于下面给出的Git变更生成 {num_options} 个专业的、遵循最佳实践的commit message，使用中文。\n\n"
+    "生成的commit message应该:\n"
+    "1. 使用现在时态\n"
+    "2. 第一行是简短的摘要 (50个字符以内)\n"
+    "3. 留一个空行后再写详细描述\n"
+    "4. 详细描述应当解释为什么进行更改，而不是如何更改\n"
+    "5. 引用任何相关问题或工单编号\n\n"
+    "{options_block}"
+    "---\n"
+    "仓库信息:\n{repo_info}\n\n"
+    "变更内容:\n{changes}\n\n"
+    "{submodule_block}"
+)
+
+_COMMIT_PROMPT_EN = (
+    "Based on the Git changes given below, generate {num_options} professional, best-practice commit messages in English.\n\n"
+    "The commit messages should:\n"
+    "1. Use present tense\n"
+    "2. Have a short summary line (max 50 characters)\n"
+    "3. Leave a blank line after the summary\n"
+    "4. Explain why the change was made, not how\n"
+    "5. Reference any related issues or tickets\n\n"
+    "{options_block}"
+    "---\n"
+    "Repository Info:\n{repo_info}\n\n"
+    "Changes:\n{changes}\n\n"
+    "{submodule_block}"
+)
+
+def generate_options_in_parallel(prompt, model, num_options):
+    """并发发起多次单条生成，每次得到一个提交信息选项"""
+    from concurrent.futures import ThreadPoolExecutor
+    
+    def generate_one(_):
+        # HTTP连接不能在线程间共享，每个请求使用自己的会话
+        session = OllamaSession(OLLAMA_HOST)
+        try:
+            return call_ollama(prompt, model, session=session, echo=False)
         finally:
-            os.chdir(current_dir)
-            debug_log(f"返回主仓库目录")
+            session.close()
     
-    debug_log("submodule处理完成，汇总信息:", submodule_summary)
-    return submodule_summary
+    with ThreadPoolExecutor(max_workers=min(num_options, OLLAMA_NUM_PARALLEL)) as executor:
+        return list(executor.map(generate_one, range(num_options)))
 
-def generate_commit_message(changes, repo_info, submodule_info, model="mistral-nemo", language="english", num_options=1):
-    """使用LLM生成commit信息"""
+def generate_commit_message(changes, repo_info, submodule_info, model="mistral-nemo", language="english", num_options=1,
+                            use_cache=True, parallel_options=False):
+    """使用LLM生成commit信息；相同模型和提示的回复会被缓存，重复运行时不再调用LLM
+    
+    parallel_options 为True且需要多个选项时，并发发起多次单条生成，不再让一次回复包含全部选项
+    返回值总是提交信息列表，只需要一个选项时长度为1；LLM调用失败或没有任何输出时返回None，
+    错误信息不会混进选项里被当作提交信息使用
+    """
     print_color(f"正在使用 {model} 生成 {num_options} 个提交信息选项 (语言: {language})...", Colors.BLUE)
     debug_log(f"开始使用LLM({model})生成提交信息，语言: {language}，选项数量: {num_options}")
     
-    # 构建提示，根据语言选择提示文本
-    if language.lower() == "chinese" or language.lower() == "中文":
-        prompt = f"请基于以下Git变更生成 {num_options} 个专业的、遵循最佳实践的commit message，使用中文。\n\n"
-        prompt += f"仓库信息:\n{repo_info}\n\n"
-        prompt += f"变更内容:\n{changes}\n\n"
-        
-        if submodule_info:
-            prompt += f"Submodule变更:\n{submodule_info}\n\n"
-        
-        prompt += "生成的commit message应该:\n"
-        prompt += "1. 使用现在时态\n"
-        prompt += "2. 第一行是简短的摘要 (50个字符以内)\n"
-        prompt += "3. 留一个空行后再写详细描述\n"
-        prompt += "4. 详细描述应当解释为什么进行更改，而不是如何更改\n"
-        prompt += "5. 引用任何相关问题或工单编号\n\n"
-        
-        if num_options > 1:
-            prompt += f"请生成 {num_options} 个不同的选项，并使用'选项1:'、'选项2:'等标记每个选项。"
+    parallel = parallel_options and num_options > 1
+    # 并发生成时每次请求只要求一个提交信息
+    prompt_options = 1 if parallel else num_options
+    
+    # 构建提示，根据语言选择提示模板，一次性格式化得到完整提示
+    if is_chinese(language):
+        template = _COMMIT_PROMPT_ZH
+        submodule_block = f"Submodule变更:\n{submodule_info}\n\n" if submodule_info else ""
+        options_block = f"请生成 {prompt_options} 个不同的选项，并使用'选项1:'、'选项2:'等标记每个选项。\n\n" if prompt_options > 1 else ""
     else:  # 默认英文
-        prompt = f"Based on the following Git changes, generate {num_options} professional, best-practice commit messages in English.\n\n"
-        prompt += f"Repository Info:\n{repo_info}\n\n"
-        prompt += f"Changes:\n{changes}\n\n"
-        
-        if submodule_info:
-            prompt += f"Submodule Changes:\n{submodule_info}\n\n"
-        
-        prompt += "The commit messages should:\n"
-        prompt += "1. Use present tense\n"
-        prompt += "2. Have a short summary line (max 50 characters)\n"
-        prompt += "3. Leave a blank line after the summary\n"
-        prompt += "4. Explain why the change was made, not how\n"
-        prompt += "5. Reference any related issues or tickets\n\n"
-        
-        if num_options > 1:
-            prompt += f"Please generate {num_options} different options and mark each option with 'Option 1:', 'Option 2:', etc."
+        template = _COMMIT_PROMPT_EN
+        submodule_block = f"Submodule Changes:\n{submodule_info}\n\n" if submodule_info else ""
+        options_block = f"Please generate {prompt_options} different options and mark each option with 'Option 1:', 'Option 2:', etc.\n\n" if prompt_options > 1 else ""
+    
+    prompt = template.format(
+        num_options=prompt_options,
+        repo_info=repo_info,
+        changes=changes,
+        submodule_block=submodule_block,
+        options_block=options_block
+    )
     
     debug_log("构建完成的LLM提示:", prompt)
     
     # 可视化提示内容
     if DEBUG:
-        print_color("\n=== LLM提示内容开始 ===", Colors.MAGENTA)
-        print(prompt)
-        print_color("=== LLM提示内容结束 ===\n", Colors.MAGENTA)
+        sys.stdout.write(f"{Colors.MAGENTA}\n=== LLM提示内容开始 ==={Colors.NC}\n{prompt}\n"
+                         f"{Colors.MAGENTA}=== LLM提示内容结束 ===\n{Colors.NC}\n")
     
-    # 调用ollama
+    # 调用ollama，提示和模型都相同时直接使用上次的回复
+    cache_key = hashlib.sha256(f"{model}|{language}|{num_options}|{parallel}|{prompt}".encode("utf-8")).hexdigest()
     try:
-        # 设置环境变量
-        env = os.environ.copy()
-        env["PYTHONIOENCODING"] = "utf-8"
-        
-        debug_log(f"开始调用ollama，模型: {model}")
-        
-        result = subprocess.run(
-            ["ollama", "run", model],
-            input=prompt,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            env=env,
-            check=True
-        )
-        ollama_response = result.stdout.strip() if result.stdout else "LLM没有返回任何输出"
+        ollama_response = load_cached_response(cache_key) if use_cache else None
+        if ollama_response is not None:
+            print_color("变更内容未变化，使用缓存的LLM回复 (使用 --no-cache 重新生成)", Colors.BLUE)
+        elif parallel:
+            ollama_response = generate_options_in_parallel(prompt, model, num_options)
+            if all(ollama_response):
+                save_cached_response(cache_key, ollama_response)
+        else:
+            ollama_response = call_ollama(prompt, model)
+            if ollama_response:
+                save_cached_response(cache_key, ollama_response)
         
         debug_log("LLM响应:", ollama_response)
         
+        # 并发生成的结果本身就是选项列表，去掉没有输出的请求
+        if parallel:
+            ollama_response = [response for response in ollama_response if response]
+        if not ollama_response:
+            print_color("LLM没有返回任何输出", Colors.RED)
+            return None
+        if parallel:
+            return ollama_response
+        
         # 如果需要多个选项，解析响应
         if num_options > 1:
             commit_options = parse_multiple_commits(ollama_response, num_options, language)
             debug_log(f"解析出 {len(commit_options)} 个提交信息选项")
             return commit_options
         else:
-            return ollama_response
+            return [ollama_response]
             
     except subprocess.CalledProcessError as e:
         print_color(f"LLM调用失败: {e}", Colors.RED)
         debug_log("LLM调用失败", str(e), "ERROR")
-        return ["LLM调用失败"] if num_options > 1 else "LLM调用失败"
+        return None
     except FileNotFoundError:
         print_color("错误: 未找到ollama命令", Colors.RED)
         debug_log("未找到ollama命令", level="ERROR")
-        return ["LLM调用失败：未找到ollama命令"] if num_options > 1 else "LLM调用失败：未找到ollama命令"
+        return None
     except Exception as e:
         print_color(f"调用LLM时发生异常: {e}", Colors.RED)
         debug_log("调用LLM时发生异常", str(e), "ERROR")
-        return [f"LLM调用异常: {str(e)}"] if num_options > 1 else f"LLM调用异常: {str(e)}"
+        return None
+
+# LLM回复中的选项标记，例如 "选项1:"、"方案 2："、"Option 1:"
+_OPTION_MARKER_RE_ZH = re.compile(r"(?:选项|方案)\s*(\d+)\s*[:：]")
+_OPTION_MARKER_RE_EN = re.compile(r"(?:Option|OPTION|Alternative)\s*(\d+)\s*:")
+# 选项标记中必定出现的字面量，回复中一个都没有时无需运行正则
+_OPTION_MARKER_LITERALS_ZH = ("选项", "方案")
+_OPTION_MARKER_LITERALS_EN = ("Option", "OPTION", "Alternative")
+# 三个及以上连续换行（兼容CRLF）视为选项之间的分隔
+_BLANK_BLOCK_RE = re.compile(r"(?:\r?\n){3,}")
+
+# 解析出的选项不足时用于占位的文本，这样的选项不能被提交
+_FAILED_OPTION_TEMPLATE = "选项 {} (生成失败)"
+_FAILED_OPTION_RE = re.compile(r"选项 \d+ \(生成失败\)")
+
+def strip_option_number(part):
+    """去掉简单分割后残留在开头的选项编号，例如 "1:"；没有编号和分隔符时原样返回"""
+    i, n = 0, len(part)
+    while i < n and part[i].isdecimal():
+        i += 1
+    if i == 0:
+        return part
+    while i < n and part[i].isspace():
+        i += 1
+    if i < n and part[i] in ":：":
+        return part[i + 1:]
+    return part
 
 def parse_multiple_commits(response, num_options, language):
     """解析LLM返回的多个commit message"""
     debug_log("开始解析多个提交信息选项")
     debug_log("原始响应内容:", response)
     
-    # 首先尝试检测是否已经有清晰的选项标记
-    if language.lower() == "chinese" or language.lower() == "中文":
-        option_patterns = [
-            r"选项\s*(\d+)\s*[:：]",
-            r"选项\s*(\d+)\s*[：:]",
-            r"方案\s*(\d+)\s*[:：]"
-        ]
+    # 首先尝试检测是否已经有清晰的选项标记，一次扫描找出所有选项的起始位置（按出现顺序）
+    if is_chinese(language):
+        option_re, literals = _OPTION_MARKER_RE_ZH, _OPTION_MARKER_LITERALS_ZH
     else:
-        option_patterns = [
-            r"Option\s*(\d+)\s*:",
-            r"OPTION\s*(\d+)\s*:",
-            r"Alternative\s*(\d+)\s*:"
-        ]
+        option_re, literals = _OPTION_MARKER_RE_EN, _OPTION_MARKER_LITERALS_EN
     
-    # 尝试查找所有选项的起始位置
     option_positions = []
-    
-    for pattern in option_patterns:
-        matches = list(re.finditer(pattern, response))
-        if matches:
-            for match in matches:
-                option_num = int(match.group(1))
-                if 1 <= option_num <= num_options:
-                    option_positions.append((option_num, match.start(), match.end()))
-            
-            # 如果找到了选项，跳出循环
-            if option_positions:
-                break
+    matches = option_re.finditer(response) if any(literal in response for literal in literals) else ()
+    for match in matches:
+        option_num = int(match.group(1))
+        if 1 <= option_num <= num_options:
+            option_positions.append((option_num, match.start(), match.end()))
     
     # 根据找到的位置分割响应
     if option_positions:
         debug_log(f"找到 {len(option_positions)} 个选项标记")
-        # 按位置排序
-        option_positions.sort(key=lambda x: x[1])
         
         commit_options = []
         for i in range(len(option_positions)):
@@ -408,20 +1100,21 @@ def parse_multiple_commits(response, num_options, language):
                 content = response[current_pos[2]:next_pos[1]].strip()
             
             commit_options.append(content)
-            debug_log(f"解析选项 {current_pos[0]}: {content[:50]}...")
+            if DEBUG:
+                debug_log(f"解析选项 {current_pos[0]}: {content[:50]}...")
         
         if len(commit_options) == num_options:
             return commit_options
     
     # 尝试使用三个连续换行符分割
     if not option_positions:
-        debug_log("未找到选项标记，尝试用三个换行符分割")
-        parts = response.split('\n\n\n')
+        debug_log("未找到选项标记，尝试用三个及以上连续换行符分割")
+        parts = _BLANK_BLOCK_RE.split(response)
         if len(parts) >= num_options:
             return [part.strip() for part in parts[:num_options]]
     
     # 如果没有找到足够的选项，尝试直接解析响应中的选项标记
-    if language.lower() == "chinese" or language.lower() == "中文":
+    if is_chinese(language):
         commit_parts = response.split("选项")
     else:
         commit_parts = response.split("Option")
@@ -432,7 +1125,7 @@ def parse_multiple_commits(response, num_options, language):
         for part in commit_parts[1:]:  # 跳过第一部分
             if part.strip():
                 # 移除选项编号
-                cleaned_part = re.sub(r"^\d+\s*[:：]", "", part).strip()
+                cleaned_part = strip_option_number(part).strip()
                 commit_options.append(cleaned_part)
                 if len(commit_options) >= num_options:
                     break
@@ -442,7 +1135,7 @@ def parse_multiple_commits(response, num_options, language):
     
     # 填充不足的选项
     while len(commit_options) < num_options:
-        commit_options.append(f"选项 {len(commit_options)+1} (生成失败)")
+        commit_options.append(_FAILED_OPTION_TEMPLATE.format(len(commit_options) + 1))
     
     # 如果解析出的选项超过请求的数量，只保留请求的数量
     if len(commit_options) > num_options:
@@ -474,13 +1167,24 @@ def select_commit_message(commit_options):
         except ValueError:
             print_color("请输入有效的数字", Colors.RED)
 
-def do_commit(message):
-    """执行提交"""
+def confirm_yes():
+    """读取用户的 y/n 确认；直接读取标准输入一行，不像input()那样初始化readline"""
+    sys.stdout.flush()
+    return sys.stdin.readline().strip().lower() in ['y', 'yes']
+
+def do_commit(message, assume_yes=False):
+    """执行提交，assume_yes 为True时不再询问确认"""
+    # 空的提交信息和生成失败的占位选项不提交，自动确认时也一样
+    if not message or not message.strip() or _FAILED_OPTION_RE.fullmatch(message.strip()):
+        print_color("错误: 提交信息为空或生成失败，未执行提交", Colors.RED)
+        debug_log("提交信息无效，拒绝提交", message, "ERROR")
+        return
+    
     # 提示用户确认
-    print_color("是否使用此信息提交? (y/n)", Colors.YELLOW)
-    confirm = input().lower()
+    if not assume_yes:
+        print_color("是否使用此信息提交? (y/n)", Colors.YELLOW)
     
-    if confirm in ['y', 'yes']:
+    if assume_yes or confirm_yes():
         debug_log("用户确认提交")
         run_git_command(["git", "commit", "-m", message])
         print_color("提交成功!", Colors.GREEN)
@@ -489,15 +1193,24 @@ def do_commit(message):
         print_color("已取消提交", Colors.YELLOW)
         debug_log("用户取消提交")
 
+@functools.lru_cache(maxsize=1)
+def find_ollama():
+    """在PATH中查找ollama可执行文件，结果在进程内缓存"""
+    import shutil
+    return shutil.which("ollama")
+
 def check_ollama_installed():
     """检查ollama是否安装"""
+    global _OLLAMA_BIN
+    
     debug_log("检查ollama是否安装")
-    if not shutil.which("ollama"):
+    _OLLAMA_BIN = find_ollama()
+    if not _OLLAMA_BIN:
         print_color("错误: 未找到ollama命令", Colors.RED)
         print_color("请安装ollama: https://github.com/ollama/ollama", Colors.RED)
         debug_log("未找到ollama命令", level="ERROR")
         return False
-    debug_log("ollama已安装")
+    debug_log(f"ollama已安装: {_OLLAMA_BIN}")
     return True
 
 def view_process():
@@ -506,9 +1219,15 @@ def view_process():
         print_color("未找到日志文件，无法查看执行过程", Colors.YELLOW)
         return
     
+    import shutil
+    
     print_color("=== 最近执行过程 ===", Colors.BLUE)
-    with open(LOG_FILE, "r", encoding="utf-8") as f:
-        print(f.read())
+    # 日志文件可能很大，按64KB分块原样复制到标准输出，不整体读入内存
+    sys.stdout.flush()
+    with open(LOG_FILE, "rb") as f:
+        shutil.copyfileobj(f, sys.stdout.buffer, 64 * 1024)
+    sys.stdout.buffer.write(b"\n")
+    sys.stdout.buffer.flush()
 
 def clear_log():
     """清空日志文件"""
@@ -556,45 +1275,47 @@ class MessageHistory:
 
 # 重新实现的交互式对话功能
 def interactive_session(commit_options, model, language, changes, repo_info, submodule_info):
-    """实现交互式会话，支持多轮对话和直接选择"""
+    """实现交互式会话，支持多轮对话和直接选择
+    
+    changes、repo_info、submodule_info 由 collect_git_context 在会话前收集一次，会话中只复用这些文本，不再调用git
+    """
     debug_log("开始交互式会话")
     
+    is_zh = is_chinese(language)
+    
     # 初始化消息历史
     history = MessageHistory()
     
     # 添加系统提示
-    if language.lower() == "chinese" or language.lower() == "中文":
+    if is_zh:
         system_prompt = "你是一个专业的Git提交信息助手，帮助用户生成高质量的commit message。请保持回答简洁专业。"
     else:
         system_prompt = "You are a professional Git commit message assistant, helping users generate high-quality commit messages. Keep your responses concise and professional."
     
     history.add_system(system_prompt)
     
-    # 添加上下文信息
-    context_prompt = ""
-    if language.lower() == "chinese" or language.lower() == "中文":
-        context_prompt += f"仓库信息:\n{repo_info}\n\n变更内容:\n{changes}\n\n"
-        if submodule_info:
-            context_prompt += f"Submodule变更:\n{submodule_info}\n\n"
+    # 添加上下文信息，变更内容可能很大，一次格式化生成
+    if is_zh:
+        submodule_block = f"Submodule变更:\n{submodule_info}\n\n" if submodule_info else ""
+        context_prompt = f"仓库信息:\n{repo_info}\n\n变更内容:\n{changes}\n\n{submodule_block}"
     else:
-        context_prompt += f"Repository Info:\n{repo_info}\n\nChanges:\n{changes}\n\n"
-        if submodule_info:
-            context_prompt += f"Submodule Changes:\n{submodule_info}\n\n"
+        submodule_block = f"Submodule Changes:\n{submodule_info}\n\n" if submodule_info else ""
+        context_prompt = f"Repository Info:\n{repo_info}\n\nChanges:\n{changes}\n\n{submodule_block}"
     
     history.add_system(context_prompt)
     
     # 添加初始推荐选项到历史记录
-    if isinstance(commit_options, str):
+    if len(commit_options) == 1:
         # 单个选项
-        recommendation = commit_options
-        if language.lower() == "chinese" or language.lower() == "中文":
+        recommendation = commit_options[0]
+        if is_zh:
             assistant_msg = f"根据您的代码变更，我推荐以下提交信息:\n\n{recommendation}"
         else:
             assistant_msg = f"Based on your code changes, I recommend the following commit message:\n\n{recommendation}"
     else:
         # 多个选项
         recommendation = format_options(commit_options, language)
-        if language.lower() == "chinese" or language.lower() == "中文":
+        if is_zh:
             assistant_msg = f"根据您的代码变更，我推荐以下几个提交信息选项:\n\n{recommendation}"
         else:
             assistant_msg = f"Based on your code changes, I recommend the following commit message options:\n\n{recommendation}"
@@ -608,7 +1329,7 @@ def interactive_session(commit_options, model, language, changes, repo_info, sub
     selected_message = None
     
     # 记录当前可用的选项（可能会被更新）
-    current_options = commit_options if isinstance(commit_options, list) else [commit_options]
+    current_options = commit_options
     
     # 记录是否有用户通过交互生成的最新消息
     has_interactive_result = False
@@ -627,7 +1348,7 @@ def interactive_session(commit_options, model, language, changes, repo_info, sub
             print("4. 退出")
             
             valid_choices = ["1", "2", "3", "4"]
-        elif isinstance(current_options, str) or len(current_options) == 1:
+        elif len(current_options) == 1:
             # 单选项菜单
             print("1. 使用这个提交信息")
             print("2. 自然语言交互")
@@ -673,24 +1394,26 @@ def interactive_session(commit_options, model, language, changes, repo_info, sub
             return None
             
         elif choice == "1" and not has_interactive_result:  # 直接选择
-            if isinstance(current_options, str) or len(current_options) == 1:
+            if len(current_options) == 1:
                 # 单个选项直接使用
-                selected_message = current_options if isinstance(current_options, str) else current_options[0]
+                selected_message = current_options[0]
                 debug_log("用户选择使用唯一的提交信息选项")
                 break
             else:
                 # 多个选项让用户选择
                 print_color("\n请输入要选择的选项编号 (1-{}): ".format(len(current_options)), Colors.GREEN, end="")
+                # int() 统一处理 "01"、" 2" 等写法；"²"、"①" 等无法解析的输入按无效数字处理
                 try:
-                    option_index = int(input().strip()) - 1
-                    if 0 <= option_index < len(current_options):
-                        selected_message = current_options[option_index]
-                        debug_log(f"用户选择了选项 {option_index + 1}")
-                        break
-                    else:
-                        print_color("无效的选项编号", Colors.RED)
+                    option_number = int(input().strip())
                 except ValueError:
                     print_color("请输入有效的数字", Colors.RED)
+                    continue
+                if 1 <= option_number <= len(current_options):
+                    selected_message = current_options[option_number - 1]
+                    debug_log(f"用户选择了选项 {option_number}")
+                    break
+                else:
+                    print_color("无效的选项编号", Colors.RED)
         
         elif choice == "2":  # 自然语言交互
             print_color("\n请输入您的自然语言指令 (如'合并选项1和2'、'增加关于性能的说明'等):", Colors.GREEN)
@@ -723,22 +1446,7 @@ def interactive_session(commit_options, model, language, changes, repo_info, sub
             debug_log("发送对话提示到LLM", prompt)
             
             try:
-                env = os.environ.copy()
-                env["PYTHONIOENCODING"] = "utf-8"
-                
-                result = subprocess.run(
-                    ["ollama", "run", model],
-                    input=prompt,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    encoding='utf-8',
-                    errors='replace',
-                    env=env,
-                    check=True
-                )
-                
-                response = result.stdout.strip() if result.stdout else ""
+                response = call_ollama(prompt, model)
                 debug_log("LLM对话响应:", response)
                 
                 # 提取提交信息
@@ -761,11 +1469,22 @@ def interactive_session(commit_options, model, language, changes, repo_info, sub
     
     return selected_message
 
+# 对话回复中的代码块，以及常见的提交信息标记（按优先级排列）
+_CODE_BLOCK_RE = re.compile(r"```(?:markdown|md)?(.*?)```", re.DOTALL)
+_MESSAGE_MARKER_RES = [
+    re.compile(pattern, re.IGNORECASE | re.DOTALL)
+    for pattern in (
+        r"提交信息:(.*?)(?=$|\n\n)",
+        r"commit message:(.*?)(?=$|\n\n)",
+        r"最终提交信息:(.*?)(?=$|\n\n)",
+        r"final commit message:(.*?)(?=$|\n\n)"
+    )
+]
+
 def extract_commit_message(response):
     """从LLM响应中提取提交信息"""
-    # 尝试提取代码块
-    code_pattern = r"```(?:markdown|md)?(.*?)```"
-    code_blocks = re.findall(code_pattern, response, re.DOTALL)
+    # 尝试提取代码块，没有代码块标记时跳过正则扫描
+    code_blocks = _CODE_BLOCK_RE.findall(response) if "```" in response else []
     
     if code_blocks:
         # 返回第一个非空代码块
@@ -774,15 +1493,8 @@ def extract_commit_message(response):
                 return block.strip()
     
     # 尝试查找常见的提交信息标记
-    message_patterns = [
-        r"提交信息:(.*?)(?=$|\n\n)",
-        r"commit message:(.*?)(?=$|\n\n)",
-        r"最终提交信息:(.*?)(?=$|\n\n)",
-        r"final commit message:(.*?)(?=$|\n\n)"
-    ]
-    
-    for pattern in message_patterns:
-        matches = re.search(pattern, response, re.IGNORECASE | re.DOTALL)
+    for pattern in _MESSAGE_MARKER_RES:
+        matches = pattern.search(response)
         if matches:
             return matches.group(1).strip()
     
@@ -791,34 +1503,35 @@ def extract_commit_message(response):
 
 def format_options(options, language):
     """格式化多个选项以便显示"""
-    result = []
-    for i, option in enumerate(options, 1):
-        if language.lower() == "chinese" or language.lower() == "中文":
-            result.append(f"--- 选项 {i} ---\n{option}")
-        else:
-            result.append(f"--- Option {i} ---\n{option}")
-    return "\n\n".join(result)
+    label = "选项" if is_chinese(language) else "Option"
+    return "\n\n".join(f"--- {label} {i} ---\n{option}" for i, option in enumerate(options, 1))
+
+# 多轮对话的提示模板
+_CONVERSATION_PROMPT_ZH = (
+    "你是一个专业的Git提交信息助手。根据下面的对话历史和用户的最新请求，生成或修改Git提交信息。\n\n"
+    "对话历史:\n"
+    "{conversation}"
+    "\n\n请回复用户的请求，提供清晰的Git提交信息。回复应简洁、专业，集中在提交信息本身。"
+    "如果你生成或修改了提交信息，请确保遵循Git最佳实践：首行简短摘要，空行后详细描述。"
+)
+
+_CONVERSATION_PROMPT_EN = (
+    "You are a professional Git commit message assistant. Based on the conversation history and the user's latest request, generate or modify a Git commit message.\n\n"
+    "Conversation history:\n"
+    "{conversation}"
+    "\n\nPlease respond to the user's request, providing a clear Git commit message. Keep your response concise and professional, focusing on the commit message itself."
+    "If you generate or modify a commit message, ensure it follows Git best practices: short summary on first line, detailed description after a blank line."
+)
 
 def build_conversation_prompt(history: MessageHistory, language: str) -> str:
     """构建用于多轮对话的提示"""
-    if language.lower() == "chinese" or language.lower() == "中文":
-        prompt = "你是一个专业的Git提交信息助手。根据下面的对话历史和用户的最新请求，生成或修改Git提交信息。\n\n"
-        prompt += "对话历史:\n"
+    if is_chinese(language):
+        template = _CONVERSATION_PROMPT_ZH
     else:
-        prompt = "You are a professional Git commit message assistant. Based on the conversation history and the user's latest request, generate or modify a Git commit message.\n\n"
-        prompt += "Conversation history:\n"
+        template = _CONVERSATION_PROMPT_EN
     
     # 添加最近的几条消息
-    prompt += history.get_conversation(max_length=10)
-    
-    if language.lower() == "chinese" or language.lower() == "中文":
-        prompt += "\n\n请回复用户的请求，提供清晰的Git提交信息。回复应简洁、专业，集中在提交信息本身。"
-        prompt += "如果你生成或修改了提交信息，请确保遵循Git最佳实践：首行简短摘要，空行后详细描述。"
-    else:
-        prompt += "\n\nPlease respond to the user's request, providing a clear Git commit message. Keep your response concise and professional, focusing on the commit message itself."
-        prompt += "If you generate or modify a commit message, ensure it follows Git best practices: short summary on first line, detailed description after a blank line."
-    
-    return prompt
+    return template.format(conversation=history.get_conversation(max_length=10))
 
 # 进度指示器相关函数
 def spinner_animation():
@@ -828,14 +1541,19 @@ def spinner_animation():
     import sys
     import time
     
-    spinner = itertools.cycle(['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏'])
     stop_spinner = threading.Event()
     
+    # 输出不是终端时动画只会产生垃圾输出，不启动线程
+    if not sys.stdout.isatty():
+        return (None, stop_spinner)
+    
+    spinner = itertools.cycle(['⠋', '⠙', '⠹', '⠸', '⠼', '⠴', '⠦', '⠧', '⠇', '⠏'])
+    
     def spin():
         while not stop_spinner.is_set():
             sys.stdout.write(f"\r{Colors.BLUE}处理中... {next(spinner)}{Colors.NC}")
             sys.stdout.flush()
-            time.sleep(0.1)
+            time.sleep(0.2)
         sys.stdout.write("\r" + " " * 20 + "\r")
         sys.stdout.flush()
     
@@ -854,11 +1572,22 @@ def stop_spinner(spinner_data):
     """停止进度指示器"""
     thread, event = spinner_data
     event.set()
-    thread.join()
+    if thread is not None:
+        thread.join()
 
-def main():
-    """主函数"""
-    parser = argparse.ArgumentParser(description="Git智能提交信息生成器")
+def positive_int(value):
+    """argparse类型：大于0的整数"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的整数: {value}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"必须大于0: {value}")
+    return number
+
+def _build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="Git智能提交信息生成器", allow_abbrev=False)
     parser.add_argument("-g", "--generate", action="store_true", help="生成提交信息")
     parser.add_argument("-c", "--commit", action="store_true", help="生成并直接提交")
     parser.add_argument("-m", "--model", default="mistral-nemo", help="指定LLM模型 (默认: mistral-nemo)")
@@ -867,21 +1596,36 @@ def main():
     parser.add_argument("-v", "--view", action="store_true", help="查看最近一次执行的过程")
     parser.add_argument("--clear-log", action="store_true", help="清空日志文件")
     parser.add_argument("-l", "--language", default="english", 
-                        choices=["english", "chinese", "英文", "中文"], 
+                        choices=["english", "chinese", *_LANG_ALIAS], 
                         help="指定commit message的语言 (默认: english)")
     parser.add_argument("-n", "--num-options", type=int, default=1,
                         help="生成的提交信息选项数量 (默认: 1)")
     parser.add_argument("--no-interactive", action="store_true", help="禁用交互模式")
-    
-    args = parser.parse_args()
-    
-    # 确保选项数量合理
-    if args.num_options < 1:
-        print_color("选项数量必须大于0，设置为默认值1", Colors.YELLOW)
-        args.num_options = 1
-    elif args.num_options > 5:
-        print_color("选项数量过多可能导致质量下降，已限制为最大值5", Colors.YELLOW)
-        args.num_options = 5
+    parser.add_argument("--parallel-options", action="store_true",
+                        help="生成多个选项时并发发起多次生成，每次只生成一个提交信息")
+    parser.add_argument("-y", "--yes", action="store_true", help="自动确认暂存和提交，不再询问")
+    parser.add_argument("--no-cache", action="store_true", help="不使用缓存，重新收集仓库上下文并重新调用LLM")
+    parser.add_argument("--no-file-summary", action="store_true",
+                        help="差异内容过大时直接截断，不逐文件总结")
+    parser.add_argument("--max-diff-bytes", type=positive_int, default=MAX_DIFF_BYTES,
+                        help=f"发送给LLM的差异内容上限，单位字节 (默认: {MAX_DIFF_BYTES})")
+    return parser
+
+# 解析器只是配置，导入时构建一次
+_PARSER = _build_parser()
+
+def main():
+    """主函数"""
+    args = _PARSER.parse_args()
+    
+    # 确保选项数量合理，只有被修正时才提示
+    requested_options = args.num_options
+    args.num_options = min(max(requested_options, 1), 5)
+    if args.num_options != requested_options:
+        if requested_options < 1:
+            print_color("选项数量必须大于0，设置为默认值1", Colors.YELLOW)
+        else:
+            print_color("选项数量过多可能导致质量下降，已限制为最大值5", Colors.YELLOW)
     
     # 设置全局调试模式
     global DEBUG
@@ -897,61 +1641,67 @@ def main():
         clear_log()
         return
     
-    # 初始化日志文件
-    if DEBUG:
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 开始新的执行记录\n\n")
-        print_color("调试模式已启用，详细过程将记录到 git-smart-commit.log", Colors.BLUE)
-    
     # 如果没有指定操作，显示帮助
     if not args.generate and not args.commit:
-        parser.print_help()
+        _PARSER.print_help()
         return
     
-    # 检查ollama是否安装
-    if not check_ollama_installed():
-        return
+    if DEBUG:
+        print_color("调试模式已启用，详细过程将记录到 git-smart-commit.log", Colors.BLUE)
     
-    # 检查是否是git仓库
-    if not check_git_repo():
-        return
+    from concurrent.futures import ThreadPoolExecutor
+    
+    # git status 与下面的环境检查互不依赖，先在后台启动，不是git仓库时结果直接丢弃
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        repo_state_future = executor.submit(collect_repo_state)
+        
+        # 检查ollama是否安装
+        if not check_ollama_installed():
+            return
+        
+        # 检查是否是git仓库
+        if not check_git_repo():
+            return
+        
+        # 检查是否有变更（一次git status获取全部状态）
+        repo_state = repo_state_future.result()
+    
+    # 前置检查都通过后才创建日志文件，此前的调试日志暂存在内存中
+    if DEBUG:
+        init_log_file()
     
     # 处理语言标识转换
-    language = args.language
-    if language == "英文":
-        language = "english"
-    elif language == "中文":
-        language = "chinese"
+    language = _LANG_ALIAS.get(args.language, args.language)
     
     debug_log(f"选择的commit message语言: {language}")
     
-    # 检查是否有变更
-    staged_changes = run_git_command(["git", "diff", "--staged"], check=False)
-    unstaged_changes = run_git_command(["git", "diff"], check=False)
-    submodule_changes = run_git_command(["git", "status"], check=False)
+    has_staged = bool(repo_state["staged"])
+    has_unstaged = bool(repo_state["unstaged"])
+    has_submodule_changes = bool(repo_state["submodules"])
     
-    debug_log("检查仓库状态:", {
-        "有已暂存更改": bool(staged_changes),
-        "有未暂存更改": bool(unstaged_changes),
-        "可能有子模块更改": "modified:" in submodule_changes
+    debug_log("检查仓库状态:", lambda: {
+        "有已暂存更改": has_staged,
+        "有未暂存更改": has_unstaged,
+        "可能有子模块更改": has_submodule_changes
     })
     
     # 如果使用-a参数并且有未暂存的更改，则先将所有更改暂存
-    if args.all and (unstaged_changes or "modified:" in submodule_changes):
+    if args.all and (has_unstaged or has_submodule_changes):
         print_color("自动暂存所有更改...", Colors.BLUE)
         run_git_command(["git", "add", "-A"])
-        staged_changes = run_git_command(["git", "diff", "--staged"], check=False)
+        repo_state = collect_repo_state()
+        has_staged = bool(repo_state["staged"])
         debug_log("已自动暂存所有更改")
     
     # 如果没有任何暂存的更改，提示用户
-    if not staged_changes:
+    if not has_staged:
         # 检查是否有未暂存的子模块更改
-        if "modified:" in submodule_changes:
+        if has_submodule_changes:
             print_color("检测到子模块更改但尚未暂存。", Colors.YELLOW)
             print_color("提示: 请使用 'git add <子模块路径>' 添加子模块更改。", Colors.YELLOW)
             debug_log("检测到未暂存的子模块更改", level="WARNING")
         # 检查是否有未暂存的普通更改
-        elif unstaged_changes:
+        elif has_unstaged:
             print_color("检测到更改但尚未暂存。", Colors.YELLOW)
             print_color("提示: 请使用 'git add <文件路径>' 添加更改。", Colors.YELLOW)
             debug_log("检测到未暂存的文件更改", level="WARNING")
@@ -960,13 +1710,18 @@ def main():
             debug_log("没有检测到任何更改", level="ERROR")
         
         # 询问用户是否要自动暂存所有更改
-        if (unstaged_changes or "modified:" in submodule_changes) and not args.all:
-            print_color("是否自动暂存所有更改并继续? (y/n)", Colors.YELLOW)
-            confirm = input().lower()
-            if confirm in ['y', 'yes']:
+        if (has_unstaged or has_submodule_changes) and not args.all:
+            # 标准输入不是终端或禁用了交互时无人应答，直接按"否"处理，避免CI或钩子中挂起
+            if not args.yes and (args.no_interactive or not sys.stdin.isatty()):
+                print_color("非交互环境，未自动暂存。可使用 -a 或 -y 自动暂存所有更改。", Colors.YELLOW)
+                debug_log("非交互环境，跳过自动暂存询问")
+                return
+            if not args.yes:
+                print_color("是否自动暂存所有更改并继续? (y/n)", Colors.YELLOW)
+            if args.yes or confirm_yes():
                 debug_log("用户确认自动暂存所有更改")
                 run_git_command(["git", "add", "-A"])
-                staged_changes = run_git_command(["git", "diff", "--staged"], check=False)
+                repo_state = collect_repo_state()
                 print_color("已暂存所有更改", Colors.GREEN)
             else:
                 debug_log("用户取消自动暂存")
@@ -974,14 +1729,15 @@ def main():
         else:
             return
     
-    # 获取仓库信息
-    repo_info = get_repo_info()
-    
-    # 获取变更内容
-    changes = get_git_changes()
+    # 获取仓库信息、变更内容和submodule变化（HEAD和索引未变化时直接使用缓存）
+    context = collect_git_context(repo_state, args.max_diff_bytes, use_cache=not args.no_cache)
+    repo_info = context["repo_info"]
+    changes = context["changes"]
+    submodule_info = context["submodule_info"]
     
-    # 处理submodule
-    submodule_info = process_submodules()
+    # 差异内容过大被截断时，先逐文件并发总结，再用摘要生成提交信息
+    if context["diff_truncated"] and not args.no_file_summary:
+        changes = summarize_changes_by_file(repo_state, args.model, language, args.max_diff_bytes)
     
     # 生成提交信息选项
     commit_options = generate_commit_message(
@@ -990,9 +1746,17 @@ def main():
         submodule_info, 
         args.model, 
         language, 
-        args.num_options
+        args.num_options,
+        use_cache=not args.no_cache,
+        parallel_options=args.parallel_options
     )
     
+    # 生成失败时没有可用的提交信息，不进入交互也不提交
+    if commit_options is None:
+        print_color("错误: 未能生成提交信息，未执行提交", Colors.RED)
+        debug_log("未能生成提交信息，结束运行", level="ERROR")
+        sys.exit(1)
+    
     # 默认启用交互模式，除非明确禁用
     if not args.no_interactive:
         selected_message = interactive_session(
@@ -1009,18 +1773,15 @@ def main():
             debug_log("用户退出交互，结束运行")
             return
     else:
-        # 非交互模式，直接使用生成的选项
-        if isinstance(commit_options, str):
-            selected_message = commit_options
-        else:
-            selected_message = commit_options[0]  # 使用第一个选项
+        # 非交互模式，直接使用第一个生成的选项
+        selected_message = commit_options[0]
         
         print_color("生成的提交信息:", Colors.GREEN)
         print(selected_message)
     
     # 如果需要提交
     if args.commit:
-        do_commit(selected_message)
+        do_commit(selected_message, assume_yes=args.yes)
     
     if DEBUG:
         print_color("\n调试信息已保存到 git-smart-commit.log 文件", Colors.BLUE)